@@ -1,36 +1,102 @@
-"""Flask app factory, route registration, and error handlers."""
+"""Quart app factory, route registration, and error handlers."""
+
+from typing import Any, override
 
 import httpx
-from flask import Flask, render_template, request
+import msgpack
+import numpy as np
+import orjson
+from quart import Quart, Response, request
+from quart.json.provider import DefaultJSONProvider
 
 from bio_explorer import gbif
 
 
-def create_app() -> Flask:
-    """Create and configure the Flask application.
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that serialises with orjson, including NumPy arrays."""
+
+    @override
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    @override
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+
+_OCCURRENCE_MIMETYPES = ["application/json", "application/msgpack"]
+
+
+def _msgpack_response(result: dict[str, Any]) -> Response:
+    """Encode an occurrences result as MessagePack.
+
+    ``points`` is sent as the raw bytes of a C-ordered little-endian
+    float64 array, alongside its ``shape``, so clients can view it
+    directly (e.g. as a ``Float64Array``) instead of parsing numbers.
+    """
+    points = np.ascontiguousarray(result["points"], dtype="<f8").reshape(-1, 2)
+    body = msgpack.packb(
+        {
+            "points": points.tobytes(),
+            "shape": list(points.shape),
+            "total": result["total"],
+            "returned": result["returned"],
+        },
+        use_bin_type=True,
+    )
+    return Response(body, mimetype="application/msgpack")
+
+
+def create_app(test_config: dict[str, Any] | None = None) -> Quart:
+    """Create and configure the Quart application.
+
+    All routes share one asyncio event loop, and with it one pool of GBIF
+    connections.  Outside of testing, a connection is warmed up in the
+    background once serving starts, so the first user request does not
+    pay for DNS and TLS setup.
+
+    Args:
+        test_config: Optional config overrides, e.g. ``{"TESTING": True}``.
 
     Returns:
-        A configured Flask instance with API routes registered.
+        A configured Quart instance with API routes registered.
     """
-    app = Flask(__name__)
+    app = Quart(__name__)
+    app.json = OrjsonProvider(app)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    @app.before_serving
+    async def start_gbif_client() -> None:
+        if not app.testing:
+            app.add_background_task(gbif.warm_up)
+
+    @app.after_serving
+    async def close_gbif_client() -> None:
+        await gbif.close_async_client()
 
     @app.get("/")
-    def index() -> str:
-        return render_template("index.html")
+    async def index() -> Response:
+        return await app.send_static_file("index.html")
 
     @app.get("/api/species/search")
-    def species_search() -> tuple[dict, int] | dict:
+    async def species_search() -> tuple[dict, int] | dict:
         query = request.args.get("q", "")
         if not query:
             return {"error": "q parameter required"}, 400
         try:
-            results = gbif.search_species(query)
+            results = await gbif.search_species(query)
         except httpx.HTTPError:
             return {"error": "GBIF service unavailable"}, 502
         return {"results": results}
 
     @app.get("/api/occurrences")
-    def occurrences() -> tuple[dict, int] | dict:
+    async def occurrences() -> tuple[dict, int] | tuple[dict | Response, dict]:
         taxon_key_raw = request.args.get("taxon_key", "")
         if not taxon_key_raw:
             return {"error": "taxon_key parameter required"}, 400
@@ -39,9 +105,12 @@ def create_app() -> Flask:
         except ValueError:
             return {"error": "taxon_key must be an integer"}, 400
         try:
-            result = gbif.get_occurrences(taxon_key)
+            result = await gbif.get_occurrences(taxon_key)
         except httpx.HTTPError:
             return {"error": "GBIF service unavailable"}, 502
-        return result
+        best = request.accept_mimetypes.best_match(_OCCURRENCE_MIMETYPES)
+        if best == "application/msgpack":
+            return _msgpack_response(result), {"Vary": "Accept"}
+        return result, {"Vary": "Accept"}
 
     return app
@@ -0,0 +1,116 @@
+"""In-process LRU caches with per-entry expiry for idempotent lookups."""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import cast, overload
+
+_MISSING = object()
+
+
+class TTLCache[K: Hashable, V]:
+    """Thread-safe LRU cache whose entries expire after a fixed lifetime.
+
+    Args:
+        maxsize: Maximum number of entries kept before the least recently
+            used one is evicted.
+        ttl: Lifetime of each entry in seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @overload
+    def get(self, key: K) -> V | None: ...
+    @overload
+    def get[D](self, key: K, default: D) -> V | D: ...
+    def get(self, key: K, default: object = None) -> object:
+        """Return the live value for *key*, or *default* if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        """Store *value* under *key*, evicting the oldest entry if full."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class CachedCoroutine[**P, R]:
+    """Coroutine function wrapper that memoises results in a ``TTLCache``.
+
+    Exceptions are not cached, so a failed lookup is retried on the next
+    call.
+    """
+
+    def __init__(
+        self,
+        func: Callable[P, Awaitable[R]],
+        cache: TTLCache[Hashable, R],
+        key: Callable[P, Hashable],
+    ) -> None:
+        functools.update_wrapper(self, func)
+        self._func = func
+        self._cache = cache
+        self._key = key
+
+    async def __call__(self, *args: P.args, **kwargs: P.kwargs) -> R:
+        cache_key = self._key(*args, **kwargs)
+        value = self._cache.get(cache_key, _MISSING)
+        if value is not _MISSING:
+            return cast("R", value)
+        result = await self._func(*args, **kwargs)
+        self._cache.set(cache_key, result)
+        return result
+
+    def cache_clear(self) -> None:
+        """Discard every cached result."""
+        self._cache.clear()
+
+
+def ttl_cache[**P, R](
+    *,
+    maxsize: int,
+    ttl: float,
+    key: Callable[P, Hashable],
+) -> Callable[[Callable[P, Awaitable[R]]], CachedCoroutine[P, R]]:
+    """Cache an async function's results for *ttl* seconds.
+
+    Args:
+        maxsize: Maximum number of cached results.
+        ttl: Lifetime of each cached result in seconds.
+        key: Builds the cache key from the call's arguments.
+
+    Returns:
+        A decorator producing a ``CachedCoroutine``.
+    """
+
+    def decorator(func: Callable[P, Awaitable[R]]) -> CachedCoroutine[P, R]:
+        cache: TTLCache[Hashable, R] = TTLCache(maxsize, ttl)
+        return CachedCoroutine(func, cache, key)
+
+    return decorator
@@ -1,24 +1,157 @@
 """GBIF API client for species search and occurrence fetching."""
 
+import asyncio
+import contextlib
+import itertools
+import math
 import random
+from array import array
+from operator import itemgetter
+from types import MappingProxyType
+from typing import NamedTuple
+from urllib.parse import urlencode
 
 import httpx
+import numpy as np
+import orjson
+
+from bio_explorer.cache import TTLCache, ttl_cache
 
 MAX_OCCURRENCE_POINTS = 10_000
 _PAGE_SIZE = 300
+# GBIF refuses occurrence searches with an offset beyond 100 000.
+_MAX_OFFSET = 100_000
+# Records fetched per taxon at most.  The reservoir sample is uniform over
+# this prefix of GBIF's result order rather than over every record, which
+# is an acceptable bias for a heatmap and bounds paging work.
+_PAGINATION_CAP = 5 * MAX_OCCURRENCE_POINTS
+# Page requests in flight per taxon; matches the connection pool size so
+# queued requests never wait on the pool for longer than one page fetch.
+_MAX_CONCURRENT_PAGES = 20
+_BASE_URL = "https://api.gbif.org/v1"
+
+# Query parameters shared by every occurrence page, encoded once.
+_OCCURRENCE_QUERY = urlencode(
+    {"hasCoordinate": "true", "hasGeospatialIssue": "false", "limit": _PAGE_SIZE}
+)
+
+_get_coords = itemgetter("decimalLatitude", "decimalLongitude")
+
+_async_client: httpx.AsyncClient | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
 
-_client: httpx.Client | None = None
 
+def _get_async_client() -> httpx.AsyncClient:
+    """Return a shared async httpx client for the running event loop.
 
-def _get_client() -> httpx.Client:
-    """Return a shared httpx client, creating it on first use."""
-    global _client  # noqa: PLW0603
-    if _client is None:
-        _client = httpx.Client(
-            base_url="https://api.gbif.org/v1",
-            timeout=20.0,
+    Pooled connections cannot outlive the loop that opened them, so the
+    client is rebuilt whenever it is requested from a different loop.
+    """
+    global _async_client, _async_client_loop  # noqa: PLW0603
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            base_url=_BASE_URL,
+            # Concurrent API requests share the pool, so waiting for a
+            # free connection gets more time than a single request.
+            timeout=httpx.Timeout(20.0, pool=60.0),
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=_MAX_CONCURRENT_PAGES,
+                max_keepalive_connections=_MAX_CONCURRENT_PAGES,
+                keepalive_expiry=30.0,
+            ),
         )
-    return _client
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Close the shared async client if it belongs to the running loop."""
+    global _async_client, _async_client_loop  # noqa: PLW0603
+    if _async_client is not None and _async_client_loop is asyncio.get_running_loop():
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
+
+async def warm_up() -> None:
+    """Open a connection to GBIF ahead of the first real request.
+
+    Failures are ignored; the first real request simply connects itself.
+    """
+    client = _get_async_client()
+    with contextlib.suppress(httpx.HTTPError):
+        await client.get("/species", params={"limit": 1}, timeout=5.0)
+
+
+def _random_open() -> float:
+    """Return a uniform float in the open interval (0, 1)."""
+    while True:
+        u = random.random()  # nosec B311
+        if u > 0.0:
+            return u
+
+
+class Reservoir:
+    """Uniform fixed-size sample of a coordinate stream, using Algorithm L.
+
+    Once the reservoir is full, the gap until the next replacement is
+    drawn from a geometric distribution, so the RNG is consulted
+    O(cap * log(n / cap)) times instead of once per point, and ``extend``
+    jumps straight between replacement positions.  Latitudes and
+    longitudes are held in two ``array('d')`` buffers rather than as a
+    list of pairs, avoiding two Python objects per point.
+
+    Args:
+        cap: Maximum number of points kept.
+    """
+
+    def __init__(self, cap: int = MAX_OCCURRENCE_POINTS) -> None:
+        self.cap = cap
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.seen = 0
+        self._w = 1.0
+        self._next = -1
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def extend(self, coords: np.ndarray) -> None:
+        """Offer an ``(n, 2)`` batch of ``[lat, lng]`` rows to the sample.
+
+        Once full, only the rows at scheduled replacement positions are
+        read; every row in between is skipped without being touched.
+        """
+        start = self.seen
+        end = start + len(coords)
+        self.seen = end
+        if start < self.cap:
+            head = coords[: self.cap - start]
+            self.lats.frombytes(np.ascontiguousarray(head[:, 0]).tobytes())
+            self.lngs.frombytes(np.ascontiguousarray(head[:, 1]).tobytes())
+            if len(head) and len(self.lats) == self.cap:
+                self._advance(self.cap - 1)
+        while start <= self._next < end:
+            lat, lng = coords[self._next - start]
+            self._replace(lat, lng)
+            self._advance(self._next)
+
+    def to_array(self) -> np.ndarray:
+        """Return the sample as an ``(n, 2)`` float64 array of ``[lat, lng]``."""
+        return np.column_stack((np.frombuffer(self.lats), np.frombuffer(self.lngs)))
+
+    def _replace(self, lat: float, lng: float) -> None:
+        slot = random.randrange(self.cap)  # nosec B311
+        self.lats[slot] = lat
+        self.lngs[slot] = lng
+
+    def _advance(self, position: int) -> None:
+        """Schedule the next replacement after stream index *position*."""
+        self._w *= math.exp(math.log(_random_open()) / self.cap)
+        skip = math.floor(math.log(_random_open()) / math.log(1.0 - self._w))
+        self._next = position + 1 + skip
 
 
 def sample_points(
@@ -33,14 +166,26 @@ def sample_points(
 
     Returns:
         The original list if its length is within *cap*, otherwise a
-        random sample of *cap* points.
+        uniform random sample of *cap* points.
     """
     if len(points) <= cap:
         return points
+    # The list is already in memory, so there is nothing to stream.
+    # random.sample picks by ratio: a partial shuffle when cap is a large
+    # share of the population, and O(cap) set-based rejection when small.
     return random.sample(points, cap)  # nosec B311
 
 
-def search_species(query: str) -> list[dict]:
+def _normalize_query(query: str) -> str:
+    """Fold case and whitespace so equivalent queries share one lookup.
+
+    The normalised form is both the cache key and the name sent to GBIF,
+    so a cached answer is exactly what GBIF returned for that key.
+    """
+    return " ".join(query.split()).casefold()
+
+
+async def search_species(query: str) -> list[dict]:
     """Resolve a species name to GBIF taxon matches.
 
     Args:
@@ -49,92 +194,167 @@ def search_species(query: str) -> list[dict]:
     Returns:
         List of dicts, each with keys ``key``, ``scientificName``,
         ``commonName``, and ``rank``.  Returns an empty list when GBIF
-        finds no match.
+        finds no match.  Queries are normalised with
+        ``_normalize_query`` before being sent, and results are cached
+        for an hour per normalised query.  Each call gets fresh dicts,
+        so callers may modify them without touching the cache.
     """
-    client = _get_client()
-    response = client.get(
+    return [dict(match) for match in await _match_species(query)]
+
+
+# Taxonomy changes rarely, so species matches are kept for an hour.
+@ttl_cache(maxsize=2048, ttl=3600, key=_normalize_query)
+async def _match_species(query: str) -> tuple[MappingProxyType, ...]:
+    """Fetch GBIF matches for *query* as read-only mappings."""
+    client = _get_async_client()
+    response = await client.get(
         "/species/match",
-        params={"name": query, "verbose": True},
+        params={"name": _normalize_query(query), "verbose": True},
     )
     response.raise_for_status()
-    data = response.json()
+    data = orjson.loads(response.content)
 
     match_type = data.get("matchType", "NONE")
     if match_type == "NONE":
-        return []
-
-    alternatives = data.get("alternatives", [])
-    primary = {
-        "key": data["usageKey"],
-        "scientificName": data.get("scientificName", ""),
-        "commonName": data.get("vernacularName", ""),
-        "rank": data.get("rank", ""),
-    }
-    results = [primary]
+        return ()
 
-    for alt in alternatives:
-        results.append(
+    return tuple(
+        MappingProxyType(
             {
-                "key": alt["usageKey"],
-                "scientificName": alt.get("scientificName", ""),
-                "commonName": alt.get("vernacularName", ""),
-                "rank": alt.get("rank", ""),
+                "key": match["usageKey"],
+                "scientificName": match.get("scientificName", ""),
+                "commonName": match.get("vernacularName", ""),
+                "rank": match.get("rank", ""),
             }
         )
+        for match in itertools.chain((data,), data.get("alternatives", []))
+    )
+
+
+class _Page(NamedTuple):
+    """The parts of an occurrence search page that get_occurrences uses."""
+
+    count: int
+    coords: np.ndarray
+
+
+# (taxon_key, offset) -> (ETag, parsed page), for conditional page requests.
+_page_etags: TTLCache[tuple[int, int], tuple[str, _Page]] = TTLCache(
+    maxsize=256, ttl=86_400
+)
 
-    return results
 
+def _parse_page(body: dict) -> _Page:
+    """Reduce a results page to its count and usable coordinate rows.
 
-def get_occurrences(taxon_key: int) -> dict:
+    Coordinates are gathered into an ``(n, 2)`` float64 array; null values
+    become NaN there, and rows containing NaN are then dropped in bulk.
+    """
+    results = body.get("results", [])
+    try:
+        rows = list(map(_get_coords, results))
+    except KeyError:
+        rows = [
+            (rec.get("decimalLatitude"), rec.get("decimalLongitude")) for rec in results
+        ]
+    coords = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    coords = coords[~np.isnan(coords).any(axis=1)]
+    return _Page(body.get("count", 0), coords)
+
+
+async def _fetch_occurrence_page(
+    client: httpx.AsyncClient,
+    taxon_key: int,
+    offset: int,
+) -> _Page:
+    """Fetch one page of the GBIF Occurrence Search API.
+
+    A page fetched before with an ``ETag`` is revalidated with
+    ``If-None-Match``; on ``304 Not Modified`` the stored page is reused
+    without transferring or parsing the body again.
+    """
+    cache_key = (taxon_key, offset)
+    cached = _page_etags.get(cache_key)
+    headers = {"If-None-Match": cached[0]} if cached is not None else {}
+    response = await client.get(
+        f"/occurrence/search?taxonKey={taxon_key}&offset={offset}&{_OCCURRENCE_QUERY}",
+        headers=headers,
+    )
+    if cached is not None and response.status_code == httpx.codes.NOT_MODIFIED:
+        return cached[1]
+    response.raise_for_status()
+    page = _parse_page(orjson.loads(response.content))
+    etag = response.headers.get("ETag")
+    if etag:
+        _page_etags.set(cache_key, (etag, page))
+    return page
+
+
+@ttl_cache(maxsize=64, ttl=600, key=lambda taxon_key: taxon_key)
+async def get_occurrences(taxon_key: int) -> dict:
     """Fetch occurrence coordinates for a taxon from GBIF.
 
-    Paginates through the GBIF Occurrence Search API, collecting
-    ``[latitude, longitude]`` pairs.  If the total exceeds
-    ``MAX_OCCURRENCE_POINTS``, the result is randomly sampled down to
-    preserve spatial distribution while keeping the client-side heatmap
+    Fetches up to ``_PAGINATION_CAP`` records from the GBIF Occurrence
+    Search API, collecting ``[latitude, longitude]`` pairs.  The first page
+    is fetched alone to learn the total ``count``; the remaining pages are
+    then requested concurrently, at most ``_MAX_CONCURRENT_PAGES`` at a
+    time.  Each page is consumed and released as soon as it arrives, so
+    only unconsumed pages are held in memory.  Points are fed through a
+    ``Reservoir``, so at most ``MAX_OCCURRENCE_POINTS`` are held at once
+    and the result is a uniform sample of the fetched records that
+    preserves spatial distribution while keeping the client-side heatmap
     performant.
 
     Args:
         taxon_key: GBIF numeric taxon key.
 
     Returns:
-        Dict with ``points`` (list of ``[lat, lng]`` pairs), ``total``
-        (full GBIF count), and ``returned`` (number of points in the
-        response).
+        Dict with ``points`` (``(n, 2)`` float64 array of ``[lat, lng]``
+        rows), ``total`` (full GBIF count), and ``returned`` (number of
+        points in the response).  Results are cached for ten minutes per
+        taxon.
     """
-    client = _get_client()
-    points: list[list[float]] = []
-    offset = 0
-    total = 0
-
-    while True:
-        response = client.get(
-            "/occurrence/search",
-            params={
-                "taxonKey": taxon_key,
-                "hasCoordinate": "true",
-                "hasGeospatialIssue": "false",
-                "limit": _PAGE_SIZE,
-                "offset": offset,
-            },
-        )
-        response.raise_for_status()
-        body = response.json()
-        total = body.get("count", 0)
-
-        for rec in body.get("results", []):
-            lat = rec.get("decimalLatitude")
-            lng = rec.get("decimalLongitude")
-            if lat is not None and lng is not None:
-                points.append([lat, lng])
+    client = _get_async_client()
+    reservoir = Reservoir()
+    first = await _fetch_occurrence_page(client, taxon_key, 0)
+    total = first.count
+    reservoir.extend(first.coords)
 
-        if body.get("endOfRecords", True):
-            break
-        offset += _PAGE_SIZE
+    # GBIF reports the same count on every page, so the first page alone
+    # fixes the remaining offsets; the range is empty for one-page taxa.
+    limit = min(total, _PAGINATION_CAP, _MAX_OFFSET)
+    offsets = iter(range(_PAGE_SIZE, limit, _PAGE_SIZE))
+    pending: set[asyncio.Task[_Page]] = set()
+    done: set[asyncio.Task[_Page]] = set()
+    try:
+        while True:
+            # Top up to _MAX_CONCURRENT_PAGES requests in flight.
+            for offset in itertools.islice(
+                offsets, _MAX_CONCURRENT_PAGES - len(pending)
+            ):
+                pending.add(
+                    asyncio.create_task(
+                        _fetch_occurrence_page(client, taxon_key, offset)
+                    )
+                )
+            if not pending:
+                break
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            # Finished tasks are popped and dropped, so each page is
+            # released as soon as it has been folded into the reservoir.
+            while done:
+                reservoir.extend(done.pop().result().coords)
+    finally:
+        for task in pending:
+            task.cancel()
+        # Retrieve every leftover outcome so failed or cancelled pages are
+        # not reported as "Task exception was never retrieved".
+        await asyncio.gather(*pending, *done, return_exceptions=True)
 
-    sampled = sample_points(points)
     return {
-        "points": sampled,
+        "points": reservoir.to_array(),
         "total": total,
-        "returned": len(sampled),
+        "returned": len(reservoir),
     }
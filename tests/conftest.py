@@ -1,14 +1,25 @@
 """Shared test fixtures."""
 
+from collections.abc import Iterator
+
 import pytest
-from flask.testing import FlaskClient
+from quart.typing import TestClientProtocol
 
+from bio_explorer import gbif
 from bio_explorer.app import create_app
 
 
+@pytest.fixture(autouse=True)
+def clear_gbif_caches() -> Iterator[None]:
+    """Start every test with empty GBIF result caches."""
+    gbif._match_species.cache_clear()
+    gbif.get_occurrences.cache_clear()
+    gbif._page_etags.clear()
+    yield
+
+
 @pytest.fixture
-def client() -> FlaskClient:
-    """Create a Flask test client with TESTING enabled."""
-    app = create_app()
-    app.config["TESTING"] = True
+def client() -> TestClientProtocol:
+    """Create a Quart test client with TESTING enabled."""
+    app = create_app({"TESTING": True})
     return app.test_client()
@@ -1,25 +1,36 @@
-"""Route tests for the Flask application."""
+"""Route tests for the Quart application."""
 
 import httpx
+import msgpack
+import numpy as np
 import pytest
-from flask.testing import FlaskClient
+from quart.testing import QuartClient
 
 from bio_explorer import gbif
 
 
-def test_index_returns_200(client: FlaskClient) -> None:
-    resp = client.get("/")
+async def test_index_returns_200(client: QuartClient) -> None:
+    resp = await client.get("/")
     assert resp.status_code == 200
+    assert resp.mimetype == "text/html"
 
 
-def test_species_search_missing_query_returns_400(client: FlaskClient) -> None:
-    resp = client.get("/api/species/search")
+async def test_index_honours_conditional_get(client: QuartClient) -> None:
+    etag = (await client.get("/")).headers["ETag"]
+    resp = await client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+
+async def test_species_search_missing_query_returns_400(
+    client: QuartClient,
+) -> None:
+    resp = await client.get("/api/species/search")
     assert resp.status_code == 400
-    assert resp.get_json()["error"] == "q parameter required"
+    assert (await resp.get_json())["error"] == "q parameter required"
 
 
-def test_species_search_with_query_returns_results(
-    client: FlaskClient,
+async def test_species_search_with_query_returns_results(
+    client: QuartClient,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     fake_results = [
@@ -30,30 +41,38 @@ def test_species_search_with_query_returns_results(
             "rank": "SPECIES",
         },
     ]
-    monkeypatch.setattr(gbif, "search_species", lambda _query: fake_results)
 
-    resp = client.get("/api/species/search?q=mountain+lion")
+    async def fake_search(_query: str) -> list[dict]:
+        return fake_results
+
+    monkeypatch.setattr(gbif, "search_species", fake_search)
+
+    resp = await client.get("/api/species/search?q=mountain+lion")
     assert resp.status_code == 200
-    data = resp.get_json()
+    data = await resp.get_json()
     assert "results" in data
     assert isinstance(data["results"], list)
     assert data["results"][0]["key"] == 2435099
 
 
-def test_occurrences_missing_taxon_key_returns_400(client: FlaskClient) -> None:
-    resp = client.get("/api/occurrences")
+async def test_occurrences_missing_taxon_key_returns_400(
+    client: QuartClient,
+) -> None:
+    resp = await client.get("/api/occurrences")
     assert resp.status_code == 400
-    assert resp.get_json()["error"] == "taxon_key parameter required"
+    assert (await resp.get_json())["error"] == "taxon_key parameter required"
 
 
-def test_occurrences_invalid_taxon_key_returns_400(client: FlaskClient) -> None:
-    resp = client.get("/api/occurrences?taxon_key=abc")
+async def test_occurrences_invalid_taxon_key_returns_400(
+    client: QuartClient,
+) -> None:
+    resp = await client.get("/api/occurrences?taxon_key=abc")
     assert resp.status_code == 400
-    assert resp.get_json()["error"] == "taxon_key must be an integer"
+    assert (await resp.get_json())["error"] == "taxon_key must be an integer"
 
 
-def test_occurrences_with_taxon_key_returns_data(
-    client: FlaskClient,
+async def test_occurrences_with_taxon_key_returns_data(
+    client: QuartClient,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     fake_result = {
@@ -61,40 +80,93 @@ def test_occurrences_with_taxon_key_returns_data(
         "total": 2,
         "returned": 2,
     }
-    monkeypatch.setattr(gbif, "get_occurrences", lambda _key: fake_result)
 
-    resp = client.get("/api/occurrences?taxon_key=2435099")
+    async def fake_get_occurrences(_key: int) -> dict:
+        return fake_result
+
+    monkeypatch.setattr(gbif, "get_occurrences", fake_get_occurrences)
+
+    resp = await client.get("/api/occurrences?taxon_key=2435099")
     assert resp.status_code == 200
-    data = resp.get_json()
+    data = await resp.get_json()
     assert "points" in data
     assert "total" in data
     assert "returned" in data
     assert len(data["points"]) == 2
 
 
-def test_species_search_gbif_error_returns_502(
-    client: FlaskClient,
+async def test_occurrences_serializes_numpy_points(
+    client: QuartClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    fake_result = {
+        "points": np.array([[40.0, -3.0], [41.0, -4.0]]),
+        "total": 2,
+        "returned": 2,
+    }
+
+    async def fake_get_occurrences(_key: int) -> dict:
+        return fake_result
+
+    monkeypatch.setattr(gbif, "get_occurrences", fake_get_occurrences)
+
+    resp = await client.get("/api/occurrences?taxon_key=2435099")
+    assert resp.status_code == 200
+    assert (await resp.get_json())["points"] == [[40.0, -3.0], [41.0, -4.0]]
+
+
+async def test_occurrences_negotiates_msgpack(
+    client: QuartClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    fake_result = {
+        "points": np.array([[40.0, -3.0], [41.0, -4.0]]),
+        "total": 5,
+        "returned": 2,
+    }
+
+    async def fake_get_occurrences(_key: int) -> dict:
+        return fake_result
+
+    monkeypatch.setattr(gbif, "get_occurrences", fake_get_occurrences)
+
+    resp = await client.get(
+        "/api/occurrences?taxon_key=2435099",
+        headers={"Accept": "application/msgpack"},
+    )
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/msgpack"
+    assert resp.headers["Vary"] == "Accept"
+    data = msgpack.unpackb(await resp.get_data(), raw=False)
+    points = np.frombuffer(data["points"], dtype="<f8").reshape(data["shape"])
+    assert points.tolist() == [[40.0, -3.0], [41.0, -4.0]]
+    assert data["total"] == 5
+    assert data["returned"] == 2
+
+
+async def test_species_search_gbif_error_returns_502(
+    client: QuartClient,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
-    def raise_http_error(_query: str) -> None:
+    async def raise_http_error(_query: str) -> None:
         raise httpx.HTTPError("connection failed")
 
     monkeypatch.setattr(gbif, "search_species", raise_http_error)
 
-    resp = client.get("/api/species/search?q=puma")
+    resp = await client.get("/api/species/search?q=puma")
     assert resp.status_code == 502
-    assert resp.get_json()["error"] == "GBIF service unavailable"
+    assert (await resp.get_json())["error"] == "GBIF service unavailable"
 
 
-def test_occurrences_gbif_error_returns_502(
-    client: FlaskClient,
+async def test_occurrences_gbif_error_returns_502(
+    client: QuartClient,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
-    def raise_http_error(_key: int) -> None:
+    async def raise_http_error(_key: int) -> None:
         raise httpx.HTTPError("connection failed")
 
     monkeypatch.setattr(gbif, "get_occurrences", raise_http_error)
 
-    resp = client.get("/api/occurrences?taxon_key=2435099")
+    resp = await client.get("/api/occurrences?taxon_key=2435099")
     assert resp.status_code == 502
-    assert resp.get_json()["error"] == "GBIF service unavailable"
+    assert (await resp.get_json())["error"] == "GBIF service unavailable"
@@ -0,0 +1,85 @@
+"""Tests for the in-process TTL cache."""
+
+import pytest
+
+from bio_explorer import cache as _cache_mod
+from bio_explorer.cache import TTLCache, ttl_cache
+
+# ---------------------------------------------------------------------------
+# TTLCache
+# ---------------------------------------------------------------------------
+
+
+def test_ttl_cache_returns_stored_value():
+    """A stored value is returned until it expires."""
+    cache = TTLCache(maxsize=4, ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("missing", "default") == "default"
+
+
+def test_ttl_cache_expires_entries(monkeypatch: pytest.MonkeyPatch):
+    """Entries older than the TTL are treated as missing and evicted."""
+    now = 1_000.0
+    monkeypatch.setattr(_cache_mod.time, "monotonic", lambda: now)
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set("a", 1)
+
+    now += 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """When full, the least recently used entry is evicted first."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+# ---------------------------------------------------------------------------
+# ttl_cache decorator
+# ---------------------------------------------------------------------------
+
+
+async def test_ttl_cache_decorator_reuses_results_per_key():
+    """Calls sharing a key are answered from the cache."""
+    calls = []
+
+    @ttl_cache(maxsize=4, ttl=60, key=lambda name: name.lower())
+    async def lookup(name: str) -> str:
+        calls.append(name)
+        return name.upper()
+
+    assert await lookup("Puma") == "PUMA"
+    assert await lookup("puma") == "PUMA"
+    assert calls == ["Puma"]
+
+    lookup.cache_clear()
+    await lookup("puma")
+    assert calls == ["Puma", "puma"]
+
+
+async def test_ttl_cache_decorator_does_not_cache_errors():
+    """A call that raises is retried rather than cached."""
+    calls = 0
+
+    @ttl_cache(maxsize=4, ttl=60, key=lambda key: key)
+    async def flaky(key: int) -> int:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("boom")
+        return key
+
+    with pytest.raises(RuntimeError):
+        await flaky(1)
+    assert await flaky(1) == 1
+    assert calls == 2
@@ -1,15 +1,25 @@
 """Tests for the GBIF API client module."""
 
+import asyncio
+import gc
+import inspect
+import weakref
+
 import httpx
+import numpy as np
+import pytest
 from hypothesis import given, settings
 from hypothesis import strategies as st
 
 from bio_explorer.gbif import (
     MAX_OCCURRENCE_POINTS,
-    _get_client,
+    Reservoir,
+    _get_async_client,
+    close_async_client,
     get_occurrences,
     sample_points,
     search_species,
+    warm_up,
 )
 
 # ---------------------------------------------------------------------------
@@ -20,28 +30,44 @@ from bio_explorer.gbif import (
 _DUMMY_REQUEST = httpx.Request("GET", "https://api.gbif.org/v1/test")
 
 
-def _make_response(status_code: int, *, json: dict) -> httpx.Response:
+def _make_response(
+    status_code: int,
+    *,
+    json: dict,
+    headers: dict | None = None,
+) -> httpx.Response:
     """Build an httpx.Response with a request attached."""
     return httpx.Response(
         status_code,
         json=json,
+        headers=headers,
         request=_DUMMY_REQUEST,
     )
 
 
+def _offset(url: str) -> int:
+    """Return the ``offset`` query parameter of a request URL."""
+    return int(httpx.URL(url).params["offset"])
+
+
 def _mock_client(monkeypatch, handler):
-    """Replace the module-level httpx client with a mock.
+    """Replace the shared httpx client with a mock.
 
     ``handler`` receives ``(url, **kwargs)`` and must return an
-    ``httpx.Response``.
+    ``httpx.Response``.  It may be a coroutine function, for tests that
+    need requests to overlap or be cancelled.
     """
     from bio_explorer import gbif as _gbif_mod
 
-    class _FakeClient:
-        def get(self, url, **kwargs):
-            return handler(url, **kwargs)
+    class _FakeAsyncClient:
+        async def get(self, url, **kwargs):
+            response = handler(url, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+            return response
 
-    monkeypatch.setattr(_gbif_mod, "_client", _FakeClient())
+    fake = _FakeAsyncClient()
+    monkeypatch.setattr(_gbif_mod, "_get_async_client", lambda: fake)
 
 
 # ---------------------------------------------------------------------------
@@ -49,7 +75,7 @@ def _mock_client(monkeypatch, handler):
 # ---------------------------------------------------------------------------
 
 
-def test_search_species_exact_match_returns_correct_shape(monkeypatch):
+async def test_search_species_exact_match_returns_correct_shape(monkeypatch):
     """An exact match returns a list with the primary result."""
 
     def handler(url, **kwargs):
@@ -67,7 +93,7 @@ def test_search_species_exact_match_returns_correct_shape(monkeypatch):
 
     _mock_client(monkeypatch, handler)
 
-    results = search_species("mountain lion")
+    results = await search_species("mountain lion")
 
     assert len(results) == 1
     result = results[0]
@@ -77,7 +103,7 @@ def test_search_species_exact_match_returns_correct_shape(monkeypatch):
     assert result["rank"] == "SPECIES"
 
 
-def test_search_species_no_match_returns_empty_list(monkeypatch):
+async def test_search_species_no_match_returns_empty_list(monkeypatch):
     """When GBIF finds no match, an empty list is returned."""
 
     def handler(url, **kwargs):
@@ -88,12 +114,12 @@ def test_search_species_no_match_returns_empty_list(monkeypatch):
 
     _mock_client(monkeypatch, handler)
 
-    results = search_species("xyznotaspecies")
+    results = await search_species("xyznotaspecies")
 
     assert results == []
 
 
-def test_search_species_includes_alternatives(monkeypatch):
+async def test_search_species_includes_alternatives(monkeypatch):
     """Alternatives from GBIF are included after the primary match."""
 
     def handler(url, **kwargs):
@@ -117,7 +143,7 @@ def test_search_species_includes_alternatives(monkeypatch):
 
     _mock_client(monkeypatch, handler)
 
-    results = search_species("alpha")
+    results = await search_species("alpha")
 
     assert len(results) == 2
     assert results[0]["key"] == 100
@@ -125,12 +151,53 @@ def test_search_species_includes_alternatives(monkeypatch):
     assert results[1]["commonName"] == "Common G"
 
 
+async def test_search_species_caches_repeat_queries(monkeypatch):
+    """Repeat queries differing only in case and whitespace hit GBIF once."""
+    sent_names = []
+
+    def handler(url, **kwargs):
+        sent_names.append(kwargs["params"]["name"])
+        return _make_response(200, json={"matchType": "NONE"})
+
+    _mock_client(monkeypatch, handler)
+
+    await search_species("Puma concolor")
+    await search_species("  PUMA   concolor ")
+
+    assert sent_names == ["puma concolor"]
+
+
+async def test_search_species_results_do_not_alias_the_cache(monkeypatch):
+    """Modifying returned matches leaves later cached results intact."""
+
+    def handler(url, **kwargs):
+        return _make_response(
+            200,
+            json={
+                "usageKey": 100,
+                "scientificName": "Puma concolor",
+                "rank": "SPECIES",
+                "matchType": "EXACT",
+            },
+        )
+
+    _mock_client(monkeypatch, handler)
+
+    first = await search_species("puma concolor")
+    first[0]["key"] = 0
+    first.clear()
+
+    again = await search_species("puma concolor")
+
+    assert [match["key"] for match in again] == [100]
+
+
 # ---------------------------------------------------------------------------
 # get_occurrences — single page
 # ---------------------------------------------------------------------------
 
 
-def test_get_occurrences_single_page_returns_points(monkeypatch):
+async def test_get_occurrences_single_page_returns_points(monkeypatch):
     """A single-page response returns all coordinate pairs."""
 
     def handler(url, **kwargs):
@@ -148,11 +215,11 @@ def test_get_occurrences_single_page_returns_points(monkeypatch):
 
     _mock_client(monkeypatch, handler)
 
-    result = get_occurrences(2435099)
+    result = await get_occurrences(2435099)
 
     assert result["total"] == 2
     assert result["returned"] == 2
-    assert result["points"] == [[51.5, -0.1], [48.8, 2.3]]
+    assert result["points"].tolist() == [[51.5, -0.1], [48.8, 2.3]]
 
 
 # ---------------------------------------------------------------------------
@@ -160,14 +227,14 @@ def test_get_occurrences_single_page_returns_points(monkeypatch):
 # ---------------------------------------------------------------------------
 
 
-def test_get_occurrences_multi_page_collects_all_points(monkeypatch):
+async def test_get_occurrences_multi_page_collects_all_points(monkeypatch):
     """Pagination collects points across multiple pages."""
-    call_count = 0
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_PAGE_SIZE", 2)
 
     def handler(url, **kwargs):
-        nonlocal call_count
-        call_count += 1
-        if call_count == 1:
+        if _offset(url) == 0:
             return _make_response(
                 200,
                 json={
@@ -193,20 +260,238 @@ def test_get_occurrences_multi_page_collects_all_points(monkeypatch):
 
     _mock_client(monkeypatch, handler)
 
-    result = get_occurrences(12345)
+    result = await get_occurrences(12345)
 
     assert result["total"] == 4
     assert result["returned"] == 4
     assert len(result["points"]) == 4
 
 
+async def test_get_occurrences_stops_paging_at_max_offset(monkeypatch):
+    """Page requests are never issued past GBIF's maximum offset."""
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_PAGE_SIZE", 10)
+    monkeypatch.setattr(_gbif_mod, "_MAX_OFFSET", 50)
+    offsets = []
+
+    def handler(url, **kwargs):
+        offsets.append(_offset(url))
+        return _make_response(
+            200,
+            json={"count": 1_000, "endOfRecords": False, "results": []},
+        )
+
+    _mock_client(monkeypatch, handler)
+
+    result = await get_occurrences(12345)
+
+    assert result["total"] == 1_000
+    assert sorted(offsets) == [0, 10, 20, 30, 40]
+
+
+async def test_get_occurrences_stops_paging_at_pagination_cap(monkeypatch):
+    """Paging stops at the pagination cap while total keeps GBIF's count."""
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_PAGE_SIZE", 10)
+    monkeypatch.setattr(_gbif_mod, "_PAGINATION_CAP", 30)
+    offsets = []
+
+    def handler(url, **kwargs):
+        offsets.append(_offset(url))
+        return _make_response(
+            200,
+            json={
+                "count": 1_000,
+                "results": [{"decimalLatitude": 1.0, "decimalLongitude": 2.0}],
+            },
+        )
+
+    _mock_client(monkeypatch, handler)
+
+    result = await get_occurrences(12345)
+
+    assert sorted(offsets) == [0, 10, 20]
+    assert result["total"] == 1_000
+    assert result["returned"] == 3
+
+
+async def test_get_occurrences_limits_pages_in_flight(monkeypatch):
+    """No more than _MAX_CONCURRENT_PAGES page requests run at once."""
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_PAGE_SIZE", 10)
+    monkeypatch.setattr(_gbif_mod, "_MAX_CONCURRENT_PAGES", 3)
+    in_flight = 0
+    peak = 0
+    offsets = []
+
+    async def handler(url, **kwargs):
+        nonlocal in_flight, peak
+        offsets.append(_offset(url))
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return _make_response(
+            200,
+            json={
+                "count": 200,
+                "results": [{"decimalLatitude": 1.0, "decimalLongitude": 2.0}],
+            },
+        )
+
+    _mock_client(monkeypatch, handler)
+
+    result = await get_occurrences(12345)
+
+    assert peak == 3
+    assert sorted(offsets) == list(range(0, 200, 10))
+    assert result["returned"] == 20
+
+
+async def test_get_occurrences_releases_consumed_pages(monkeypatch):
+    """Pages already folded into the reservoir are not kept alive."""
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_PAGE_SIZE", 10)
+    parse_page = _gbif_mod._parse_page
+    refs = {}
+
+    def tracking_parse_page(body):
+        page = parse_page(body)
+        refs[body["offset"]] = weakref.ref(page.coords)
+        return page
+
+    monkeypatch.setattr(_gbif_mod, "_parse_page", tracking_parse_page)
+    alive_while_last_page_loads = []
+
+    async def handler(url, **kwargs):
+        offset = _offset(url)
+        if offset == 30:
+            await asyncio.sleep(0.05)
+            gc.collect()
+            alive_while_last_page_loads.extend(
+                o for o in (10, 20) if refs[o]() is not None
+            )
+        return _make_response(
+            200,
+            json={
+                "count": 40,
+                "offset": offset,
+                "results": [{"decimalLatitude": 1.0, "decimalLongitude": 2.0}],
+            },
+        )
+
+    _mock_client(monkeypatch, handler)
+
+    result = await get_occurrences(12345)
+
+    assert result["returned"] == 4
+    assert alive_while_last_page_loads == []
+
+
+async def test_get_occurrences_retrieves_every_failed_page(monkeypatch):
+    """When several pages fail together, no task error goes unretrieved."""
+    loop = asyncio.get_running_loop()
+    unhandled = []
+    loop.set_exception_handler(lambda _loop, context: unhandled.append(context))
+
+    def handler(url, **kwargs):
+        if _offset(url) > 0:
+            return _make_response(503, json={})
+        return _make_response(200, json={"count": 3_000, "results": []})
+
+    _mock_client(monkeypatch, handler)
+
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            await get_occurrences(12345)
+        await asyncio.sleep(0)
+        gc.collect()
+    finally:
+        loop.set_exception_handler(None)
+
+    assert unhandled == []
+
+
+async def test_get_occurrences_page_error_cancels_remaining_pages(monkeypatch):
+    """A failing page raises its HTTP error and cancels outstanding pages."""
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_PAGE_SIZE", 10)
+    cancelled = []
+
+    async def handler(url, **kwargs):
+        offset = _offset(url)
+        if offset == 10:
+            return _make_response(500, json={})
+        if offset > 10:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(offset)
+                raise
+        return _make_response(
+            200,
+            json={"count": 40, "endOfRecords": False, "results": []},
+        )
+
+    _mock_client(monkeypatch, handler)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await get_occurrences(12345)
+    assert sorted(cancelled) == [20, 30]
+
+
+# ---------------------------------------------------------------------------
+# get_occurrences — conditional requests
+# ---------------------------------------------------------------------------
+
+
+async def test_get_occurrences_reuses_page_on_not_modified(monkeypatch):
+    """A page revalidated with its ETag is reused when GBIF returns 304."""
+    from bio_explorer import gbif as _gbif_mod
+
+    seen_headers = []
+
+    def handler(url, **kwargs):
+        headers = kwargs.get("headers", {})
+        seen_headers.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return _make_response(304, json={})
+        return _make_response(
+            200,
+            json={
+                "count": 1,
+                "endOfRecords": True,
+                "results": [{"decimalLatitude": 1.0, "decimalLongitude": 2.0}],
+            },
+            headers={"ETag": '"v1"'},
+        )
+
+    _mock_client(monkeypatch, handler)
+
+    first = await get_occurrences(5)
+    _gbif_mod.get_occurrences.cache_clear()
+    second = await get_occurrences(5)
+
+    assert seen_headers == [{}, {"If-None-Match": '"v1"'}]
+    assert second["total"] == first["total"] == 1
+    assert second["points"].tolist() == [[1.0, 2.0]]
+
+
 # ---------------------------------------------------------------------------
 # get_occurrences — sampling cap
 # ---------------------------------------------------------------------------
 
 
-def test_get_occurrences_samples_when_exceeding_cap(monkeypatch):
+async def test_get_occurrences_samples_when_exceeding_cap(monkeypatch):
     """When points exceed MAX_OCCURRENCE_POINTS, result is sampled down."""
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_PAGE_SIZE", 12_000)
     big_results = [
         {"decimalLatitude": float(i), "decimalLongitude": float(i)}
         for i in range(12_000)
@@ -224,7 +509,7 @@ def test_get_occurrences_samples_when_exceeding_cap(monkeypatch):
 
     _mock_client(monkeypatch, handler)
 
-    result = get_occurrences(99999)
+    result = await get_occurrences(99999)
 
     assert result["total"] == 12_000
     assert result["returned"] == MAX_OCCURRENCE_POINTS
@@ -236,8 +521,8 @@ def test_get_occurrences_samples_when_exceeding_cap(monkeypatch):
 # ---------------------------------------------------------------------------
 
 
-def test_get_occurrences_skips_null_coordinates(monkeypatch):
-    """Records with null lat or lng are excluded."""
+async def test_get_occurrences_skips_null_coordinates(monkeypatch):
+    """Records with null or missing lat or lng are excluded."""
 
     def handler(url, **kwargs):
         return _make_response(
@@ -249,16 +534,17 @@ def test_get_occurrences_skips_null_coordinates(monkeypatch):
                     {"decimalLatitude": 10.0, "decimalLongitude": 20.0},
                     {"decimalLatitude": None, "decimalLongitude": 30.0},
                     {"decimalLatitude": 40.0, "decimalLongitude": None},
+                    {"decimalLatitude": 50.0},
                 ],
             },
         )
 
     _mock_client(monkeypatch, handler)
 
-    result = get_occurrences(111)
+    result = await get_occurrences(111)
 
     assert result["returned"] == 1
-    assert result["points"] == [[10.0, 20.0]]
+    assert result["points"].tolist() == [[10.0, 20.0]]
 
 
 # ---------------------------------------------------------------------------
@@ -282,6 +568,55 @@ def test_sample_points_samples_down_when_over_cap():
     assert len(result) == 10
 
 
+# ---------------------------------------------------------------------------
+# Reservoir — unit tests
+# ---------------------------------------------------------------------------
+
+
+def test_reservoir_keeps_everything_until_full():
+    """Items are kept in arrival order until the cap is reached."""
+    reservoir = Reservoir(cap=5)
+    reservoir.extend(np.array([[0.0, 0.0], [1.0, 1.0]]))
+    reservoir.extend(np.array([[2.0, 2.0]]))
+
+    assert reservoir.to_array().tolist() == [[0.0, 0.0], [1.0, 1.0], [2.0, 2.0]]
+    assert reservoir.to_array().shape == (3, 2)
+
+
+def test_reservoir_samples_uniformly():
+    """Every stream position is retained with probability cap / n."""
+    n, cap, trials = 50, 5, 2_000
+    rows = np.column_stack((np.arange(n, dtype=np.float64), np.zeros(n)))
+    counts = [0] * n
+    for _ in range(trials):
+        reservoir = Reservoir(cap=cap)
+        reservoir.extend(rows)
+        assert len(reservoir) == cap
+        for lat in reservoir.lats:
+            counts[int(lat)] += 1
+
+    expected = trials * cap / n
+    assert all(0.6 * expected < c < 1.4 * expected for c in counts)
+
+
+def test_reservoir_extend_samples_uniformly_across_batches():
+    """Rows split across batches are still retained with probability cap / n."""
+    n, cap, trials = 50, 5, 2_000
+    rows = np.column_stack((np.arange(n, dtype=np.float64), np.zeros(n)))
+    counts = [0] * n
+    for _ in range(trials):
+        reservoir = Reservoir(cap=cap)
+        for start in range(0, n, 7):
+            reservoir.extend(rows[start : start + 7])
+        assert len(reservoir) == cap
+        assert reservoir.seen == n
+        for lat in reservoir.lats:
+            counts[int(lat)] += 1
+
+    expected = trials * cap / n
+    assert all(0.6 * expected < c < 1.4 * expected for c in counts)
+
+
 # ---------------------------------------------------------------------------
 # sample_points — Hypothesis property tests
 # ---------------------------------------------------------------------------
@@ -330,18 +665,54 @@ def test_sample_points_preserves_valid_coordinates(raw_points):
 
 
 # ---------------------------------------------------------------------------
-# _get_client returns a shared instance
+# warm_up
 # ---------------------------------------------------------------------------
 
 
-def test_get_client_returns_httpx_client(monkeypatch):
-    """_get_client creates and returns an httpx.Client."""
+async def test_warm_up_ignores_gbif_errors(monkeypatch):
+    """A failed warm-up request does not raise."""
+
+    def handler(url, **kwargs):
+        raise httpx.ConnectError("unreachable")
+
+    _mock_client(monkeypatch, handler)
+
+    await warm_up()
+
+
+# ---------------------------------------------------------------------------
+# _get_async_client returns a shared instance
+# ---------------------------------------------------------------------------
+
+
+def test_get_async_client_reused_within_a_loop(monkeypatch):
+    """_get_async_client returns one httpx.AsyncClient per event loop."""
+    from bio_explorer import gbif as _gbif_mod
+
+    monkeypatch.setattr(_gbif_mod, "_async_client", None)
+    monkeypatch.setattr(_gbif_mod, "_async_client_loop", None)
+
+    async def get_twice():
+        return _get_async_client(), _get_async_client()
+
+    first, second = asyncio.run(get_twice())
+    other, _ = asyncio.run(get_twice())
+
+    assert isinstance(first, httpx.AsyncClient)
+    assert first is second
+    assert other is not first
+
+
+async def test_close_async_client_closes_and_resets(monkeypatch):
+    """close_async_client closes the loop's client so the next is fresh."""
     from bio_explorer import gbif as _gbif_mod
 
-    monkeypatch.setattr(_gbif_mod, "_client", None)
-    client = _get_client()
+    monkeypatch.setattr(_gbif_mod, "_async_client", None)
+    monkeypatch.setattr(_gbif_mod, "_async_client_loop", None)
+    client = _get_async_client()
 
-    assert isinstance(client, httpx.Client)
+    await close_async_client()
 
-    # Cleanup: reset to None so other tests are not affected.
-    monkeypatch.setattr(_gbif_mod, "_client", None)
+    assert client.is_closed
+    assert _get_async_client() is not client
+    await close_async_client()